@@ -0,0 +1,90 @@
+"""Generate a grid of class-conditional samples from a VAR model and save it."""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import numpy as np
+import torch
+import torchvision
+
+from var import VAR, VQVAE
+
+
+def load_var(max_scale: int, device: torch.device, ckpt: str = None) -> VAR:
+    """Build the VAR model, streaming weights from a checkpoint if given.
+
+    With a checkpoint, the model is constructed on the meta device and the
+    weights are mmap-loaded with safetensors — no multi-second random init
+    of hundreds of MB of parameters that are about to be overwritten.
+    """
+    if ckpt is None:
+        return VAR(max_scale=max_scale).to(device).eval()
+    from safetensors.torch import load_model
+
+    with torch.device("meta"):
+        var = VAR(max_scale=max_scale)
+    var = var.to_empty(device=device)
+    load_model(var, ckpt, device=str(device))
+    return var.eval()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ckpt", default=None, help="VAR weights (.safetensors)")
+    parser.add_argument("--vqvae-ckpt", default=None, help="VQ-VAE weights (.safetensors)")
+    parser.add_argument("--num-samples", type=int, default=4)
+    parser.add_argument("--output", default="generated_samples.png")
+    return parser.parse_args()
+
+
+def denormalize_image(img: torch.Tensor) -> np.ndarray:
+    """Map a [-1, 1] CHW tensor to an HWC uint8 array.
+
+    The scale/clamp/cast all happen on the device in one pass, so only uint8
+    bytes cross to the host (4x less transfer than fp32).
+    """
+    img = img.mul(127.5).add(127.5).clamp(0, 255).to(torch.uint8)
+    return img.permute(1, 2, 0).contiguous().cpu().numpy()
+
+
+def denormalize_batch(imgs: torch.Tensor) -> np.ndarray:
+    """Map [-1, 1] NCHW tensors to an NHWC uint8 array with one host transfer."""
+    imgs = imgs.mul(127.5).add(127.5).clamp(0, 255).to(torch.uint8)
+    return imgs.permute(0, 2, 3, 1).contiguous().cpu().numpy()
+
+
+def main():
+    args = parse_args()
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    num_samples = args.num_samples
+    max_scale = 16
+
+    vqvae = VQVAE().to(device).eval()
+    if args.vqvae_ckpt is not None:
+        from safetensors.torch import load_model
+
+        load_model(vqvae, args.vqvae_ckpt, device=str(device))
+    var = load_var(max_scale, device, args.ckpt)
+    print(f"VQVAE parameters: {sum(p.numel() for p in vqvae.parameters()):,}")
+    print(f"VAR parameters: {sum(p.numel() for p in var.parameters()):,}")
+
+    labels = torch.arange(num_samples, device=device)
+    with torch.inference_mode():
+        tokens = var.generate(batch_size=num_samples, labels=labels, device=device)
+        images = vqvae.decode_from_flat_indices(tokens, max_scale)
+
+    # Native PNG encoding: make_grid on device-side uint8 plus libpng-backed
+    # write_png is orders of magnitude cheaper than rendering through
+    # matplotlib, which dwarfed actual generation time at low scales.
+    grid = torchvision.utils.make_grid(
+        images.mul(127.5).add(127.5).clamp(0, 255).to(torch.uint8), nrow=num_samples
+    )
+    torchvision.io.write_png(grid.cpu(), args.output)
+    print(f"Saved samples to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Minimal VAR sampling example using a small configuration."""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import torch
+
+from var import VAR, VQVAE
+
+
+def build_var(max_scale: int, device: torch.device, ckpt: str = None) -> VAR:
+    """Build the small VAR config, mmap-loading weights when a checkpoint is given."""
+    config = dict(
+        vocab_size=512,
+        d_model=256,
+        n_heads=8,
+        n_layers=6,
+        d_ff=1024,
+        max_scale=max_scale,
+        num_classes=10,
+    )
+    if ckpt is None:
+        return VAR(**config).to(device).eval()
+    from safetensors.torch import load_model
+
+    # Meta-device construction skips random init of weights that are about
+    # to be overwritten by the checkpoint.
+    with torch.device("meta"):
+        var = VAR(**config)
+    var = var.to_empty(device=device)
+    load_model(var, ckpt, device=str(device))
+    return var.eval()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ckpt", default=None, help="VAR weights (.safetensors)")
+    args = parser.parse_args()
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    max_scale = 8
+
+    vqvae = VQVAE(hidden_dim=64, embedding_dim=64, num_embeddings=512).to(device).eval()
+    var = build_var(max_scale, device, args.ckpt)
+    print(f"VAR parameters: {sum(p.numel() for p in var.parameters()):,}")
+
+    with torch.inference_mode():
+        tokens = var.generate(
+            batch_size=1, labels=torch.tensor([3], device=device), device=device
+        )
+        image = vqvae.decode_from_flat_indices(tokens, max_scale)
+
+    print(f"Sampled {tokens.size(1)} tokens -> image of shape {tuple(image.shape)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""Visual Autoregressive Modeling: scalable image generation via next-scale prediction."""
+
+from .trainer import VARTrainer, create_trainer
+from .var import VAR, AdaptiveLayerNorm, TransformerBlock
+from .vqvae import VQVAE, ResidualBlock, VectorQuantizer
+from .utils import (
+    compute_scale_positions,
+    create_causal_mask,
+    get_multi_scale_patches,
+    positional_encoding_2d,
+    rearrange_for_scale,
+    sample_from_logits,
+    scale_offsets_tensor,
+    scale_position_arrays,
+    top_k_top_p_filtering,
+)
+
+__all__ = [
+    "AdaptiveLayerNorm",
+    "ResidualBlock",
+    "TransformerBlock",
+    "VAR",
+    "VARTrainer",
+    "VQVAE",
+    "VectorQuantizer",
+    "compute_scale_positions",
+    "create_trainer",
+    "create_causal_mask",
+    "get_multi_scale_patches",
+    "positional_encoding_2d",
+    "rearrange_for_scale",
+    "sample_from_logits",
+    "scale_offsets_tensor",
+    "scale_position_arrays",
+    "top_k_top_p_filtering",
+]
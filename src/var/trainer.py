@@ -0,0 +1,302 @@
+"""Training loop for the VAR transformer on tokens from a frozen VQ-VAE."""
+
+import concurrent.futures
+import os
+from typing import Iterator, Optional, Tuple
+
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader, Dataset
+from tqdm import tqdm
+
+from .var import VAR
+from .vqvae import VQVAE
+
+try:
+    from safetensors.torch import load_file, save_file
+
+    _HAS_SAFETENSORS = True
+except ImportError:  # pragma: no cover - optional dependency
+    _HAS_SAFETENSORS = False
+
+
+def _to_cpu(obj):
+    """Recursively detach tensors in a state structure to CPU copies.
+
+    ``copy=True`` forces a fresh copy even when the tensor already lives on
+    the CPU, so tied weights (token embedding / to_logits) come out with
+    separate storages — safetensors' save_file rejects shared memory.
+    """
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to("cpu", copy=True)
+    if isinstance(obj, dict):
+        return {k: _to_cpu(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_to_cpu(v) for v in obj]
+    return obj
+
+
+class VARTrainer:
+    """Trains a VAR model against codebook indices produced by a frozen VQ-VAE.
+
+    The VQ-VAE is frozen, so its codebook indices for a given image never
+    change. With ``cache_tokens`` enabled (the default) the whole dataset is
+    tokenized once, in large batches under bfloat16 autocast, and the indices
+    are kept on the CPU as int16 — subsequent epochs never run the VQ-VAE at
+    all.
+    """
+
+    def __init__(
+        self,
+        var_model: VAR,
+        vqvae_model: VQVAE,
+        dataset: Dataset,
+        device: torch.device,
+        batch_size: int = 32,
+        lr: float = 1e-4,
+        weight_decay: float = 0.05,
+        grad_clip: float = 1.0,
+        checkpoint_dir: str = "checkpoints",
+        cache_tokens: bool = True,
+        log_every: int = 50,
+        num_workers: int = 4,
+        checkpoint_every: int = 1,
+    ):
+        self.device = device
+        self.log_every = log_every
+        self.var_model = var_model.to(device)
+        self.vqvae_model = vqvae_model.to(device)
+        self.vqvae_model.eval()
+        for param in self.vqvae_model.parameters():
+            param.requires_grad_(False)
+        # The tokenizer only has to get the argmin over the codebook right,
+        # so reduced precision is safe: BF16 weights on CUDA halve its VRAM
+        # and HBM traffic; on CPU, dynamically quantize what core supports
+        # (linear layers — dynamic conv quantization isn't available).
+        if device.type == "cuda":
+            self.vqvae_model = self.vqvae_model.to(torch.bfloat16)
+        else:
+            self.vqvae_model = torch.ao.quantization.quantize_dynamic(
+                self.vqvae_model, {nn.Linear}, dtype=torch.qint8
+            )
+
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.grad_clip = grad_clip
+        self.num_workers = num_workers
+        # Pinned host memory lets the non_blocking .to() calls below overlap
+        # the H2D copy with compute instead of serializing on it.
+        self.pin_memory = device.type == "cuda"
+        self.dataloader = DataLoader(
+            dataset,
+            batch_size=batch_size,
+            shuffle=True,
+            num_workers=num_workers,
+            pin_memory=self.pin_memory,
+            persistent_workers=num_workers > 0,
+            prefetch_factor=4 if num_workers > 0 else None,
+        )
+        # The fused AdamW applies the whole update in one multi-tensor kernel
+        # instead of one launch per parameter; it is CUDA-only.
+        self.optimizer = torch.optim.AdamW(
+            self.var_model.parameters(),
+            lr=lr,
+            weight_decay=weight_decay,
+            fused=device.type == "cuda",
+        )
+
+        self.cache_tokens = cache_tokens
+        self._token_cache: Optional[torch.Tensor] = None
+        self._label_cache: Optional[torch.Tensor] = None
+
+        self.epoch = 0
+        self.checkpoint_dir = checkpoint_dir
+        self.checkpoint_every = checkpoint_every
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        suffix = "safetensors" if _HAS_SAFETENSORS else "pt"
+        self._model_path_template = os.path.join(
+            checkpoint_dir, "var_epoch_{epoch}." + suffix
+        )
+        self._opt_path_template = os.path.join(checkpoint_dir, "var_epoch_{epoch}_opt.pt")
+        # Checkpoints are written from a single background thread so disk I/O
+        # never blocks the training step; at most one write is in flight.
+        self._save_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._save_future: Optional[concurrent.futures.Future] = None
+
+    def _tokenize(self, images: torch.Tensor) -> torch.Tensor:
+        """Run the frozen VQ-VAE tokenizer, under autocast on CUDA."""
+        with torch.inference_mode():
+            if self.device.type == "cuda":
+                with torch.autocast(device_type="cuda", dtype=torch.bfloat16):
+                    return self.vqvae_model.get_codebook_indices(images)
+            return self.vqvae_model.get_codebook_indices(images)
+
+    def _build_token_cache(self) -> None:
+        """Tokenize the entire dataset once and keep the indices on the CPU.
+
+        Tokenization runs at 4x the training batch size: the frozen encoder
+        has no optimizer state, so the larger batch is free and amortizes
+        kernel launches. Indices fit in int16 for codebooks up to 32k entries.
+        """
+        loader = DataLoader(
+            self.dataset,
+            batch_size=self.batch_size * 4,
+            shuffle=False,
+            num_workers=self.num_workers,
+            pin_memory=self.pin_memory,
+        )
+        all_tokens, all_labels = [], []
+        for images, labels in tqdm(loader, desc="Tokenizing dataset"):
+            images = images.to(self.device, non_blocking=True)
+            tokens = self._tokenize(images)
+            all_tokens.append(tokens.to(torch.int16).cpu())
+            all_labels.append(labels)
+        self._token_cache = torch.cat(all_tokens, dim=0)
+        self._label_cache = torch.cat(all_labels, dim=0)
+
+    def _iter_batches(self) -> Iterator[Tuple[torch.Tensor, torch.Tensor]]:
+        """Yield (tokens, labels) batches on the training device."""
+        if self.cache_tokens:
+            if self._token_cache is None:
+                self._build_token_cache()
+            perm = torch.randperm(self._token_cache.size(0))
+            for start in range(0, perm.size(0), self.batch_size):
+                idx = perm[start : start + self.batch_size]
+                tokens = self._token_cache[idx].to(self.device, non_blocking=True).long()
+                labels = self._label_cache[idx].to(self.device, non_blocking=True)
+                yield tokens, labels
+        else:
+            for images, labels in self.dataloader:
+                images = images.to(self.device, non_blocking=True)
+                labels = labels.to(self.device, non_blocking=True)
+                # _tokenize returns inference tensors, which autograd refuses
+                # to save for backward; clone() outside inference mode makes
+                # them ordinary tensors before they reach the VAR forward.
+                yield self._tokenize(images).clone(), labels
+
+    def train_epoch(self) -> float:
+        """Run one training epoch and return the mean loss."""
+        self.var_model.train()
+        # loss.item() forces a GPU->CPU sync, so losses accumulate on-device
+        # and are only read back once per logging window.
+        running_loss = torch.zeros((), device=self.device)
+        total_loss = 0.0
+        num_batches = 0
+        pbar = tqdm(self._iter_batches(), desc=f"Epoch {self.epoch}")
+        for tokens, labels in pbar:
+            # BF16 autocast halves activation bandwidth and engages tensor
+            # cores; unlike FP16 it shares the FP32 exponent range, so no
+            # GradScaler is needed. Master weights stay FP32 in the optimizer.
+            with torch.autocast(
+                device_type=self.device.type,
+                dtype=torch.bfloat16,
+                enabled=self.device.type == "cuda",
+            ):
+                logits, loss = self.var_model(tokens, labels, return_loss=True)
+            self.optimizer.zero_grad(set_to_none=True)
+            loss.backward()
+            nn.utils.clip_grad_norm_(
+                self.var_model.parameters(), self.grad_clip, foreach=True
+            )
+            self.optimizer.step()
+
+            running_loss += loss.detach()
+            num_batches += 1
+            if num_batches % self.log_every == 0:
+                window_loss = running_loss.item()
+                running_loss.zero_()
+                total_loss += window_loss
+                pbar.set_postfix({"loss": f"{window_loss / self.log_every:.4f}"})
+        total_loss += running_loss.item()
+        self.epoch += 1
+        return total_loss / max(num_batches, 1)
+
+    @torch.inference_mode()
+    def generate_samples(
+        self, num_samples: int = 4, labels: Optional[torch.Tensor] = None
+    ) -> torch.Tensor:
+        """Sample token sequences and decode the finest scale to images."""
+        self.var_model.eval()
+        tokens = self.var_model.generate(
+            batch_size=num_samples, labels=labels, device=self.device, use_cache=True
+        )
+        images = self.vqvae_model.decode_from_flat_indices(
+            tokens, self.var_model.max_scale
+        )
+        self.var_model.train()
+        return images
+
+    @staticmethod
+    def _write_checkpoint(model_state, opt_state, model_path, opt_path) -> None:
+        if _HAS_SAFETENSORS:
+            save_file(model_state, model_path)
+        else:
+            torch.save(model_state, model_path)
+        torch.save(opt_state, opt_path)
+
+    def save_checkpoint(self) -> str:
+        """Write model/optimizer state for the current epoch; returns the weights path.
+
+        Weights go to a ``.safetensors`` file when safetensors is installed
+        (no pickle, mmap-friendly) with optimizer state in a sibling
+        ``_opt.pt``. State is detached to CPU up front and written from the
+        background thread, so training continues while the bytes hit disk.
+        """
+        if self._save_future is not None:
+            self._save_future.result()  # surface errors; keep one write in flight
+        model_path = self._model_path_template.format(epoch=self.epoch)
+        opt_path = self._opt_path_template.format(epoch=self.epoch)
+        # torch.compile wraps the model in an OptimizedModule whose state-dict
+        # keys carry an _orig_mod. prefix; save the underlying module's state
+        # so checkpoints load into plain VAR instances too.
+        var_model = getattr(self.var_model, "_orig_mod", self.var_model)
+        model_state = _to_cpu(var_model.state_dict())
+        opt_state = {"optimizer": _to_cpu(self.optimizer.state_dict()), "epoch": self.epoch}
+        self._save_future = self._save_executor.submit(
+            self._write_checkpoint, model_state, opt_state, model_path, opt_path
+        )
+        return model_path
+
+    def load_checkpoint(self, path: str) -> None:
+        """Restore model/optimizer state from a checkpoint file."""
+        var_model = getattr(self.var_model, "_orig_mod", self.var_model)
+        if path.endswith(".safetensors"):
+            var_model.load_state_dict(load_file(path, device=str(self.device)))
+            opt_path = path[: -len(".safetensors")] + "_opt.pt"
+        else:
+            var_model.load_state_dict(torch.load(path, map_location=self.device))
+            opt_path = path[: -len(".pt")] + "_opt.pt"
+        if os.path.exists(opt_path):
+            checkpoint = torch.load(opt_path, map_location=self.device)
+            self.optimizer.load_state_dict(checkpoint["optimizer"])
+            self.epoch = checkpoint["epoch"]
+
+    def train(self, num_epochs: int) -> None:
+        """Train for ``num_epochs`` epochs, checkpointing every ``checkpoint_every``."""
+        for _ in range(num_epochs):
+            avg_loss = self.train_epoch()
+            print(f"Epoch {self.epoch}: loss {avg_loss:.4f}")
+            if self.epoch % self.checkpoint_every == 0:
+                self.save_checkpoint()
+        if self._save_future is not None:
+            self._save_future.result()
+
+
+def create_trainer(
+    var_model: VAR,
+    vqvae_model: VQVAE,
+    dataset: Dataset,
+    device: Optional[torch.device] = None,
+    **kwargs,
+) -> VARTrainer:
+    """Build a :class:`VARTrainer`, picking CUDA automatically when available.
+
+    On CUDA the VAR model is wrapped with ``torch.compile`` before the
+    optimizer is constructed, so inductor fuses the forward/backward graph and
+    the per-step kernel-launch overhead (dominant at small d_model) drops.
+    """
+    if device is None:
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    if device.type == "cuda":
+        var_model = torch.compile(var_model, mode="reduce-overhead", dynamic=False)
+    return VARTrainer(var_model, vqvae_model, dataset, device, **kwargs)
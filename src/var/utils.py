@@ -0,0 +1,327 @@
+"""Utility functions for multi-scale token sequences, masking and sampling."""
+
+import functools
+import math
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+# Positional encodings are pure functions of their arguments, so we build each
+# one once and hand the cached tensor back to every caller.  The generate loop
+# asks for the encoding of every scale on every step; after warm-up those
+# lookups are O(1) and allocation-free.
+_PE_CACHE: Dict[Tuple[int, int, int, torch.device, torch.dtype], torch.Tensor] = {}
+
+
+def positional_encoding_2d(
+    h: int,
+    w: int,
+    d_model: int,
+    device: Optional[torch.device] = None,
+    dtype: torch.dtype = torch.float32,
+) -> torch.Tensor:
+    """Create a 2D sinusoidal positional encoding.
+
+    The y-position is encoded in the first ``d_model // 2`` channels and the
+    x-position in the second half, following the standard ViT-style 2D
+    scheme — every position ``(y, x)`` gets a distinct encoding, not just
+    every row.
+
+    Results are memoized per ``(h, w, d_model, device, dtype)``; callers get a
+    shared tensor and must not modify it in place.
+
+    Args:
+        h: Grid height.
+        w: Grid width.
+        d_model: Embedding dimension (must be divisible by 4).
+        device: Device to build the encoding on.
+        dtype: Output dtype.
+
+    Returns:
+        Tensor of shape ``[h, w, d_model]``.
+    """
+    if d_model % 4 != 0:
+        raise ValueError(f"d_model must be divisible by 4, got {d_model}")
+    device = torch.device(device) if device is not None else torch.device("cpu")
+    key = (h, w, d_model, device, dtype)
+    pe = _PE_CACHE.get(key)
+    if pe is None:
+        half = d_model // 2
+        div_term = torch.exp(
+            torch.arange(0, half, 2, device=device, dtype=torch.float32)
+            * (-math.log(10000.0) / half)
+        )
+        y_angles = torch.outer(torch.arange(h, device=device, dtype=torch.float32), div_term)
+        x_angles = torch.outer(torch.arange(w, device=device, dtype=torch.float32), div_term)
+        # Interleave sin/cos along the channel dim: [n, half/2, 2] -> [n, half].
+        pe_y = torch.stack((y_angles.sin(), y_angles.cos()), dim=-1).flatten(-2)
+        pe_x = torch.stack((x_angles.sin(), x_angles.cos()), dim=-1).flatten(-2)
+        pe = torch.cat(
+            (pe_y[:, None, :].expand(h, w, half), pe_x[None, :, :].expand(h, w, half)),
+            dim=-1,
+        ).to(dtype)
+        _PE_CACHE[key] = pe
+    return pe
+
+
+# For any reasonable top_p the nucleus lies well inside the highest-scoring
+# ~1024 entries, so the cumulative-probability test only needs a partially
+# sorted candidate set instead of a full O(V log V) sort of the vocabulary.
+_TOP_P_CANDIDATES = 1024
+
+
+def _filter_top_k_top_p(
+    logits: torch.Tensor, top_k: int, top_p: float, filter_value: float
+) -> torch.Tensor:
+    """Functional top-k/top-p filtering body, written to be fusible by inductor."""
+    if top_k <= 0 and top_p >= 1.0:
+        return logits
+    num_candidates = top_k if top_p >= 1.0 else max(top_k, _TOP_P_CANDIDATES)
+    num_candidates = min(num_candidates, logits.size(-1))
+    # topk returns values sorted descending, so no follow-up sort is needed.
+    values, indices = torch.topk(logits, num_candidates)
+    cumulative_probs = torch.cumsum(F.softmax(values, dim=-1), dim=-1)
+    # Shift right so the first token crossing the threshold is kept.
+    keep = F.pad(cumulative_probs[..., :-1], (1, 0)) < top_p
+    if top_k > 0:
+        keep &= torch.arange(num_candidates, device=logits.device) < top_k
+    mask = torch.zeros_like(logits, dtype=torch.bool)
+    mask.scatter_(-1, indices, keep)
+    return torch.where(mask, logits, filter_value)
+
+
+# The filtering chain (topk, sort, softmax, cumsum, scatter, masked writes) is
+# four to five kernel launches per sampled token, which dominates sampler
+# latency at small batch sizes.  On CUDA we run it through torch.compile so
+# inductor fuses the pointwise tail into a couple of kernels; the eager path
+# stays as the CPU fallback.
+_COMPILED_FILTER = None
+
+
+def _get_compiled_filter():
+    global _COMPILED_FILTER
+    if _COMPILED_FILTER is None:
+        _COMPILED_FILTER = torch.compile(
+            _filter_top_k_top_p, mode="reduce-overhead", dynamic=False
+        )
+    return _COMPILED_FILTER
+
+
+def top_k_top_p_filtering(
+    logits: torch.Tensor,
+    top_k: int = 0,
+    top_p: float = 1.0,
+    filter_value: float = float("-inf"),
+) -> torch.Tensor:
+    """Filter a distribution of logits using top-k and/or nucleus (top-p) filtering.
+
+    Args:
+        logits: Logits of shape ``[batch, vocab_size]``.
+        top_k: Keep only the k tokens with the highest probability (0 = disabled).
+        top_p: Keep the smallest set of tokens whose cumulative probability
+            exceeds ``top_p`` (1.0 = disabled).
+        filter_value: Value assigned to removed tokens.
+
+    Returns:
+        The filtered logits.
+    """
+    if logits.is_cuda:
+        return _get_compiled_filter()(logits, top_k, top_p, filter_value)
+    return _filter_top_k_top_p(logits, top_k, top_p, filter_value)
+
+
+def _sample_ids(
+    logits: torch.Tensor, temperature: float, top_k: int, top_p: float,
+    filter_value: float,
+) -> torch.Tensor:
+    """Temperature scaling, filtering and a Gumbel-max draw as one fusible region.
+
+    ``argmax(logits + Gumbel(0, 1))`` samples the exact softmax distribution
+    without materializing it: no probability tensor, no CDF scan — a
+    pointwise add and a reduction replace softmax + multinomial.  Filtered
+    entries sit at ``-inf`` and can never win the argmax.
+    """
+    logits = logits.float() / temperature
+    logits = _filter_top_k_top_p(logits, top_k, top_p, filter_value)
+    gumbel = -torch.log(torch.empty_like(logits).exponential_())
+    return (logits + gumbel).argmax(dim=-1)
+
+
+# Like the filter above, the whole sampling chain is compiled on CUDA so the
+# temperature divide and Gumbel add fuse with the filtering tail.  Unlike
+# multinomial, the Gumbel draw is a plain elementwise op over inductor's
+# Philox RNG, so the entire step is graph-capture safe.
+_COMPILED_SAMPLE = None
+
+
+def _get_compiled_sample():
+    global _COMPILED_SAMPLE
+    if _COMPILED_SAMPLE is None:
+        _COMPILED_SAMPLE = torch.compile(
+            _sample_ids, mode="reduce-overhead", dynamic=False
+        )
+    return _COMPILED_SAMPLE
+
+
+def sample_from_logits(
+    logits: torch.Tensor,
+    temperature: float = 1.0,
+    top_k: int = 0,
+    top_p: float = 1.0,
+    filter_value: float = float("-inf"),
+) -> torch.Tensor:
+    """Sample token ids from logits with temperature and top-k/top-p filtering.
+
+    Consolidates the per-step sampling math (temperature divide, filtering,
+    Gumbel-max draw) behind one call, compiled on CUDA. Computation happens
+    in FP32 regardless of input dtype.
+
+    Args:
+        logits: Logits of shape ``[..., vocab_size]``.
+        temperature: Softmax temperature.
+        top_k: Keep only the k tokens with the highest probability (0 = disabled).
+        top_p: Nucleus sampling cutoff (1.0 = disabled).
+        filter_value: Value assigned to removed tokens.
+
+    Returns:
+        Long tensor of sampled ids with shape ``logits.shape[:-1]``.
+    """
+    flat = logits.reshape(-1, logits.size(-1))
+    if flat.is_cuda:
+        tokens = _get_compiled_sample()(flat, temperature, top_k, top_p, filter_value)
+    else:
+        tokens = _sample_ids(flat, temperature, top_k, top_p, filter_value)
+    return tokens.view(logits.shape[:-1])
+
+
+# One canonical lower-triangular mask per device, grown on demand.  Every
+# request is served as a slice of the cached tensor, so the generate loop
+# never re-allocates or re-initializes the O(seq_len^2) mask.  Attention
+# implementations that support ``is_causal=True`` (scaled_dot_product_attention)
+# should prefer that flag and skip the mask entirely.
+_CAUSAL_CACHE: Dict[torch.device, torch.Tensor] = {}
+
+
+def create_causal_mask(seq_len: int, device: Optional[torch.device] = None) -> torch.Tensor:
+    """Create a causal attention mask.
+
+    Args:
+        seq_len: Sequence length.
+        device: Device to build the mask on.
+
+    Returns:
+        Bool tensor of shape ``[seq_len, seq_len]`` where ``True`` means
+        "may attend". The result is a view into a cached canonical mask and
+        must not be modified in place.
+    """
+    device = torch.device(device) if device is not None else torch.device("cpu")
+    mask = _CAUSAL_CACHE.get(device)
+    if mask is None or mask.size(0) < seq_len:
+        mask = torch.tril(torch.ones(seq_len, seq_len, dtype=torch.bool, device=device))
+        _CAUSAL_CACHE[device] = mask
+    return mask[:seq_len, :seq_len]
+
+
+@functools.lru_cache(maxsize=64)
+def scale_position_arrays(max_scale: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Start/end offsets of each scale as vectorized int64 arrays.
+
+    Computed as a prefix sum over the per-scale token counts, so indexing
+    code can gather/scatter against scale boundaries without Python loops.
+    The cached arrays are marked read-only.
+
+    Args:
+        max_scale: Largest scale (side length) in the schedule.
+
+    Returns:
+        Arrays ``(starts, ends)``, each of shape ``[max_scale]``.
+    """
+    scales = np.arange(1, max_scale + 1, dtype=np.int64)
+    num_tokens = scales * scales
+    ends = np.cumsum(num_tokens)
+    starts = ends - num_tokens
+    starts.setflags(write=False)
+    ends.setflags(write=False)
+    return starts, ends
+
+
+@functools.lru_cache(maxsize=64)
+def compute_scale_positions(max_scale: int) -> Tuple[Tuple[int, ...], Tuple[int, ...]]:
+    """Compute the start/end offsets of each scale in the flattened sequence.
+
+    Scale ``s`` contributes ``s * s`` tokens, so the flattened sequence for
+    ``max_scale`` scales has ``sum(s^2 for s in 1..max_scale)`` positions.
+    Thin compatibility wrapper over :func:`scale_position_arrays`.
+
+    Args:
+        max_scale: Largest scale (side length) in the schedule.
+
+    Returns:
+        Tuples ``(starts, ends)`` with one entry per scale.
+    """
+    starts, ends = scale_position_arrays(max_scale)
+    return tuple(starts.tolist()), tuple(ends.tolist())
+
+
+@functools.lru_cache(maxsize=64)
+def get_multi_scale_patches(max_scale: int) -> Tuple[Tuple[int, int], ...]:
+    """Return the ``(scale, num_tokens)`` schedule for multi-scale generation.
+
+    Pure function of ``max_scale``; results are memoized.
+
+    Args:
+        max_scale: Largest scale (side length) in the schedule.
+
+    Returns:
+        Tuple of ``(scale, scale * scale)`` pairs, coarsest first.
+    """
+    return tuple((scale, scale * scale) for scale in range(1, max_scale + 1))
+
+
+_OFFSETS_CACHE: Dict[Tuple[int, torch.device], torch.Tensor] = {}
+
+
+def scale_offsets_tensor(
+    max_scale: int, device: Optional[torch.device] = None
+) -> torch.Tensor:
+    """Cumulative scale boundary offsets as a cached long tensor.
+
+    ``offsets[i]`` is the start of scale ``i + 1`` in the flattened sequence
+    and ``offsets[-1]`` is the total sequence length, so scale ``i + 1``
+    occupies ``[offsets[i], offsets[i + 1])``.
+
+    Args:
+        max_scale: Largest scale (side length) in the schedule.
+        device: Device to build the tensor on.
+
+    Returns:
+        Long tensor of shape ``[max_scale + 1]``; cached, do not modify.
+    """
+    device = torch.device(device) if device is not None else torch.device("cpu")
+    key = (max_scale, device)
+    offsets = _OFFSETS_CACHE.get(key)
+    if offsets is None:
+        starts, ends = compute_scale_positions(max_scale)
+        offsets = torch.tensor((*starts, ends[-1]), dtype=torch.long, device=device)
+        _OFFSETS_CACHE[key] = offsets
+    return offsets
+
+
+def rearrange_for_scale(tokens: torch.Tensor, scale: int) -> torch.Tensor:
+    """Reshape the leading tokens of a flat sequence into a square grid.
+
+    The result is always a view: ``narrow`` + ``view`` never copy, unlike
+    slice + ``reshape`` which silently copies non-contiguous inputs. Callers
+    must pass a contiguous tensor.
+
+    Args:
+        tokens: Contiguous token tensor of shape ``[batch, seq_len]``.
+        scale: Side length of the grid; the first ``scale * scale`` tokens
+            are used.
+
+    Returns:
+        View of shape ``[batch, scale, scale]``.
+    """
+    return tokens.narrow(1, 0, scale * scale).view(tokens.size(0), scale, scale)
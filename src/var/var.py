@@ -0,0 +1,576 @@
+"""VAR transformer: class-conditional next-token prediction over multi-scale token sequences."""
+
+from typing import Optional, Tuple, Union
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from .utils import (
+    compute_scale_positions,
+    get_multi_scale_patches,
+    positional_encoding_2d,
+    sample_from_logits,
+)
+
+# TF32 tensor-core matmuls are a safe default for this model family and act
+# as the fallback speedup wherever the BF16 autocast regions below don't
+# apply (e.g. FP32 eager debugging).
+torch.backends.cuda.matmul.allow_tf32 = True
+
+
+class AdaptiveLayerNorm(nn.Module):
+    """LayerNorm modulated by externally supplied scale and shift.
+
+    The conditioning projection lives at the VAR level, where one GEMM feeds
+    every AdaLN in the stack; what remains here is normalize followed by one
+    affine chain of pointwise ops, which inductor fuses into a single kernel
+    under torch.compile.
+    """
+
+    def __init__(self, d_model: int):
+        super().__init__()
+        self.norm = nn.LayerNorm(d_model, elementwise_affine=False)
+
+    def forward(
+        self, x: torch.Tensor, scale: torch.Tensor, shift: torch.Tensor
+    ) -> torch.Tensor:
+        return self.norm(x) * (1 + scale.unsqueeze(1)) + shift.unsqueeze(1)
+
+
+class Int8Linear(nn.Module):
+    """Weight-only int8 linear layer with per-output-channel scales.
+
+    Weights are stored as int8 (4x smaller than FP32) and dequantized to the
+    activation dtype at matmul time; activations are untouched. The bandwidth
+    win is specific to the frozen compiled decode stack, where inductor folds
+    the dequant into the GEMM prologue and the kernel reads only int8 weights
+    from HBM. In eager execution the dequant materializes a full-precision
+    weight copy per call, so quantization saves storage there, not bandwidth.
+    Inference-only: gradients do not flow to the quantized weights.
+    """
+
+    def __init__(self, linear: nn.Linear):
+        super().__init__()
+        weight = linear.weight.detach()
+        scale = weight.abs().amax(dim=1, keepdim=True).clamp(min=1e-8) / 127.0
+        self.register_buffer("weight_int8", torch.round(weight / scale).to(torch.int8))
+        self.register_buffer("scale", scale)
+        self.bias = linear.bias
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        weight = self.weight_int8.to(x.dtype) * self.scale.to(x.dtype)
+        return F.linear(x, weight, self.bias)
+
+
+def apply_rotary(t: torch.Tensor, cos: torch.Tensor, sin: torch.Tensor) -> torch.Tensor:
+    """Rotate ``[batch, heads, len, head_dim]`` q/k by per-position angles.
+
+    Rotate-half (GPT-NeoX) convention: the head dim is split in two and the
+    halves rotated against each other, equivalent to even/odd interleaving up
+    to a fixed channel permutation. ``cos``/``sin`` have shape
+    ``[len, head_dim // 2]``.
+    """
+    cos = cos.to(t.dtype)[None, None]
+    sin = sin.to(t.dtype)[None, None]
+    t1, t2 = t.chunk(2, dim=-1)
+    return torch.cat((t1 * cos - t2 * sin, t1 * sin + t2 * cos), dim=-1)
+
+
+class TransformerBlock(nn.Module):
+    """Pre-norm transformer block with adaptive layer norm conditioning.
+
+    Attention runs through ``scaled_dot_product_attention`` with
+    ``is_causal=True``: causality is enforced inside the fused kernel
+    (FlashAttention-2 on supported GPUs), so no O(L^2) mask or attention
+    matrix is ever materialized in HBM.
+    """
+
+    def __init__(self, d_model: int, n_heads: int, d_ff: int, dropout: float = 0.1):
+        super().__init__()
+        if d_model % n_heads != 0:
+            raise ValueError(f"d_model {d_model} not divisible by n_heads {n_heads}")
+        self.n_heads = n_heads
+        self.head_dim = d_model // n_heads
+        self.q_proj = nn.Linear(d_model, d_model)
+        self.k_proj = nn.Linear(d_model, d_model)
+        self.v_proj = nn.Linear(d_model, d_model)
+        self.out_proj = nn.Linear(d_model, d_model)
+        self.attn_dropout = dropout
+        # The conditioning projection for all layers lives in VAR.cond_proj;
+        # blocks just receive their scale/shift slice.
+        self.adaln1 = AdaptiveLayerNorm(d_model)
+        self.adaln2 = AdaptiveLayerNorm(d_model)
+        # Explicit FFN weights let inductor fuse GELU into the first GEMM's
+        # epilogue; functional dropout below disappears entirely in eval
+        # instead of dispatching no-op kernels.
+        self.w1 = nn.Linear(d_model, d_ff)
+        self.w2 = nn.Linear(d_ff, d_model)
+        self.dropout_p = dropout
+
+    def _ffn(self, x: torch.Tensor) -> torch.Tensor:
+        x = F.gelu(self.w1(x))
+        if self.training and self.dropout_p > 0:
+            x = F.dropout(x, self.dropout_p, training=True)
+        x = self.w2(x)
+        if self.training and self.dropout_p > 0:
+            x = F.dropout(x, self.dropout_p, training=True)
+        return x
+
+    def forward(
+        self,
+        x: torch.Tensor,
+        scale_shift: torch.Tensor,
+        rope: Optional[Tuple[torch.Tensor, torch.Tensor]] = None,
+        kv_cache: Optional[Tuple[torch.Tensor, torch.Tensor]] = None,
+        pos: int = 0,
+        update_cache: bool = True,
+    ) -> torch.Tensor:
+        """Run the block, optionally against a KV cache.
+
+        Args:
+            x: Input of shape ``[batch, seq_len, d_model]``.
+            scale_shift: This layer's AdaLN conditioning of shape
+                ``[batch, 4, d_model]``, ordered scale1/shift1/scale2/shift2.
+            rope: Optional ``(cos, sin)`` rotary tables for the absolute
+                positions of ``x``, each ``[seq_len, head_dim // 2]``.
+            kv_cache: Optional ``(k, v)`` tensors of shape
+                ``[batch, n_heads, max_seq_len, head_dim]``. The block only
+                computes q/k/v for its new tokens and attends against the
+                cached prefix.
+            pos: With ``update_cache``, the write offset of ``x`` within the
+                cached sequence; otherwise the length of the cached prefix to
+                attend over.
+            update_cache: Write the new keys/values into the cache (context
+                tokens). When False, the queries read the cache but leave it
+                untouched — used for the per-scale parallel queries, which
+                must not see each other.
+        """
+        scale1, shift1, scale2, shift2 = scale_shift.unbind(dim=1)
+        h = self.adaln1(x, scale1, shift1)
+        batch_size, seq_len, _ = h.shape
+        q = self.q_proj(h).view(batch_size, seq_len, self.n_heads, self.head_dim)
+        k = self.k_proj(h).view(batch_size, seq_len, self.n_heads, self.head_dim)
+        v = self.v_proj(h).view(batch_size, seq_len, self.n_heads, self.head_dim)
+        q = q.transpose(1, 2)
+        k = k.transpose(1, 2)
+        v = v.transpose(1, 2)
+        if rope is not None:
+            q = apply_rotary(q, *rope)
+            # Cached keys were rotated when written; only rotate keys that
+            # are new here.
+            if kv_cache is None or update_cache:
+                k = apply_rotary(k, *rope)
+        attn_mask = None
+        if kv_cache is not None:
+            k_cache, v_cache = kv_cache
+            if update_cache:
+                k_cache[:, :, pos : pos + seq_len] = k
+                v_cache[:, :, pos : pos + seq_len] = v
+                k = k_cache[:, :, : pos + seq_len]
+                v = v_cache[:, :, : pos + seq_len]
+                if seq_len > 1:
+                    # Stepped causal mask: query at absolute position pos+j
+                    # may attend keys 0..pos+j (is_causal would misalign the
+                    # diagonal against the longer cached key sequence).
+                    key_idx = torch.arange(pos + seq_len, device=x.device)
+                    query_idx = torch.arange(pos, pos + seq_len, device=x.device)
+                    attn_mask = key_idx[None, :] <= query_idx[:, None]
+            else:
+                k = k_cache[:, :, :pos]
+                v = v_cache[:, :, :pos]
+        attn_out = F.scaled_dot_product_attention(
+            q,
+            k,
+            v,
+            attn_mask=attn_mask,
+            dropout_p=self.attn_dropout if self.training else 0.0,
+            is_causal=kv_cache is None,
+        )
+        attn_out = attn_out.transpose(1, 2).reshape(batch_size, seq_len, -1)
+        x = x + self.out_proj(attn_out)
+        x = x + self._ffn(self.adaln2(x, scale2, shift2))
+        return x
+
+
+class VAR(nn.Module):
+    """Class-conditional autoregressive transformer over multi-scale VQ tokens.
+
+    The token sequence concatenates every scale's flattened grid, coarsest
+    first. Position 0 of the transformer input is the class embedding, so
+    the logits at position ``i`` predict token ``i`` of the sequence.
+
+    No causal mask is ever materialized: training relies on SDPA's in-kernel
+    ``is_causal`` and generation on the KV cache's filled-prefix semantics.
+    """
+
+    def __init__(
+        self,
+        vocab_size: int = 4096,
+        d_model: int = 768,
+        n_heads: int = 12,
+        n_layers: int = 12,
+        d_ff: int = 3072,
+        max_scale: int = 16,
+        num_classes: int = 1000,
+        dropout: float = 0.1,
+    ):
+        super().__init__()
+        self.vocab_size = vocab_size
+        self.d_model = d_model
+        self.max_scale = max_scale
+        self.num_classes = num_classes
+        self.total_seq_len = sum(n for _, n in get_multi_scale_patches(max_scale))
+
+        self.token_embedding = nn.Embedding(vocab_size, d_model)
+        self.class_embedding = nn.Embedding(num_classes, d_model)
+        # Sequence position is rotary: encoded in q/k inside attention via
+        # the cos/sin tables below instead of a learned [1, L, D] table added
+        # to (and read with) every activation tensor. The sinusoidal
+        # per-scale 2D encoding still carries within-scale spatial layout.
+        head_dim = d_model // n_heads
+        inv_freq = 1.0 / (
+            10000.0 ** (torch.arange(0, head_dim, 2, dtype=torch.float32) / head_dim)
+        )
+        angles = torch.outer(
+            torch.arange(self.total_seq_len, dtype=torch.float32), inv_freq
+        )
+        self.register_buffer("rope_cos", angles.cos())
+        self.register_buffer("rope_sin", angles.sin())
+        self.dropout = nn.Dropout(dropout)
+        self.transformer_blocks = nn.ModuleList(
+            [TransformerBlock(d_model, n_heads, d_ff, dropout) for _ in range(n_layers)]
+        )
+        # All layers' AdaLN scale/shift come from one GEMM on the condition
+        # vector, replacing n_layers tiny latency-bound [B, D] x [D, 4D]
+        # projections; during generation it runs once per call, not per pass.
+        self.cond_proj = nn.Linear(d_model, 4 * d_model * n_layers)
+        self.norm_out = nn.LayerNorm(d_model)
+        self.to_logits = nn.Linear(d_model, vocab_size)
+        self._compiled_decode_stack = None
+        self._compiled_stack = None
+
+        self.apply(self._init_weights)
+        # Tie the output projection to the token embedding: one shared
+        # [vocab, d_model] matrix instead of two (saves vocab*d_model
+        # parameters and their optimizer state, and the shared gradient is a
+        # mild regularizer). The bias stays independent.
+        self.to_logits.weight = self.token_embedding.weight
+
+    @staticmethod
+    def _init_weights(module: nn.Module) -> None:
+        if isinstance(module, nn.Linear):
+            nn.init.trunc_normal_(module.weight, std=0.02)
+            if module.bias is not None:
+                nn.init.zeros_(module.bias)
+        elif isinstance(module, nn.Embedding):
+            nn.init.trunc_normal_(module.weight, std=0.02)
+
+    def _cond_scale_shift(self, condition: torch.Tensor) -> torch.Tensor:
+        """Project the condition to per-layer AdaLN terms: ``[B, n_layers, 4, D]``."""
+        return self.cond_proj(condition).view(
+            condition.size(0), len(self.transformer_blocks), 4, self.d_model
+        )
+
+    def _scale_pos_encoding(
+        self, seq_len: int, device: torch.device, dtype: torch.dtype
+    ) -> torch.Tensor:
+        """Assemble the per-scale 2D positional encoding for a sequence prefix."""
+        parts = []
+        filled = 0
+        for scale, num_tokens in get_multi_scale_patches(self.max_scale):
+            if filled >= seq_len:
+                break
+            pe = positional_encoding_2d(scale, scale, self.d_model, device, dtype)
+            pe = pe.view(num_tokens, self.d_model)
+            take = seq_len - filled
+            parts.append(pe if take >= num_tokens else pe[:take])
+            filled += num_tokens
+        return torch.cat(parts, dim=0)
+
+    def forward(
+        self,
+        tokens: torch.Tensor,
+        labels: torch.Tensor,
+        return_loss: bool = True,
+    ) -> Union[torch.Tensor, Tuple[torch.Tensor, torch.Tensor]]:
+        """Teacher-forced forward pass.
+
+        Args:
+            tokens: Token sequence of shape ``[batch, total_seq_len]``.
+            labels: Class labels of shape ``[batch]``.
+            return_loss: If True, also return the cross-entropy loss.
+
+        Returns:
+            Logits of shape ``[batch, seq_len, vocab_size]``, and the loss if
+            ``return_loss`` is set.
+        """
+        batch_size, seq_len = tokens.shape
+        device = tokens.device
+        # BF16 autocast halves activation bandwidth on the attention/FFN/
+        # logits GEMMs; the loss below is deliberately computed in FP32.
+        with torch.autocast(
+            device_type=device.type,
+            dtype=torch.bfloat16,
+            enabled=device.type == "cuda",
+        ):
+            condition = self.class_embedding(labels)
+
+            x = self.token_embedding(tokens)
+            x = torch.cat((condition.unsqueeze(1), x[:, :-1]), dim=1)
+            x = x + self._scale_pos_encoding(seq_len, device, x.dtype)
+            if self.training:
+                x = self.dropout(x)
+
+            rope = (self.rope_cos[:seq_len], self.rope_sin[:seq_len])
+            cond_scale_shift = self._cond_scale_shift(condition)
+            run_stack = self._stack() if device.type == "cuda" else self._run_stack
+            x = run_stack(x, cond_scale_shift, rope=rope)
+            x = self.norm_out(x)
+            logits = self.to_logits(x)
+
+        if not return_loss:
+            return logits
+        # cross_entropy accepts [batch, vocab, seq] directly; transpose is a
+        # stride change, so no contiguous [B*L, V] copy of the logits is made.
+        loss = F.cross_entropy(logits.float().transpose(1, 2), tokens)
+        return logits, loss
+
+    def quantize_for_inference(self) -> "VAR":
+        """Quantize the bandwidth-dominant projections to weight-only int8.
+
+        Covers every FFN linear and ``to_logits`` — the layers whose weight
+        reads dominate decode HBM traffic. Embeddings stay full precision
+        (index lookups, not GEMMs); quantizing ``to_logits`` unties it from
+        the token embedding, which is fine inference-side. Call after
+        training/loading weights; the model is no longer trainable afterwards.
+
+        Pair with the compiled decode stack: inductor freezing is enabled
+        here so the recompiled kernels fold the dequant into the GEMM and
+        read the int8 weights directly (see :class:`Int8Linear`).
+        """
+        import torch._inductor.config as inductor_config
+
+        for block in self.transformer_blocks:
+            block.w1 = Int8Linear(block.w1)
+            block.w2 = Int8Linear(block.w2)
+        self.to_logits = Int8Linear(self.to_logits)
+        # Freezing constant-folds module weights into the compiled graphs;
+        # safe from here on since the model is inference-only. Drop any
+        # existing compiled wrappers so the next call retraces the quantized
+        # modules with freezing active.
+        inductor_config.freezing = True
+        self._compiled_decode_stack = None
+        self._compiled_stack = None
+        return self
+
+    def allocate_kv_cache(
+        self, batch_size: int, device: torch.device, dtype: torch.dtype
+    ) -> torch.Tensor:
+        """Allocate the KV cache for all layers as one contiguous tensor.
+
+        One allocation of shape ``[n_layers, 2, batch, n_heads, total_seq_len,
+        head_dim]`` instead of ``2 * n_layers`` separate tensors: a single
+        trip through the caching allocator, no fragmentation across cache
+        lifetimes, and layer ``i`` reads ``cache[i, 0]`` / ``cache[i, 1]``
+        as plain views.
+        """
+        block = self.transformer_blocks[0]
+        return torch.empty(
+            len(self.transformer_blocks), 2, batch_size, block.n_heads,
+            self.total_seq_len, block.head_dim, device=device, dtype=dtype,
+        )
+
+    def _run_stack(
+        self,
+        x: torch.Tensor,
+        cond_scale_shift: torch.Tensor,
+        rope=None,
+        kv_caches=None,
+        pos: int = 0,
+        update_cache: bool = True,
+    ) -> torch.Tensor:
+        """Run the transformer blocks under BF16 autocast on CUDA."""
+        with torch.autocast(
+            device_type=x.device.type,
+            dtype=torch.bfloat16,
+            enabled=x.device.type == "cuda",
+        ):
+            if kv_caches is None:
+                for i, block in enumerate(self.transformer_blocks):
+                    x = block(x, cond_scale_shift[:, i], rope=rope)
+            else:
+                for i, block in enumerate(self.transformer_blocks):
+                    x = block(
+                        x, cond_scale_shift[:, i], rope=rope,
+                        kv_cache=kv_caches[i], pos=pos,
+                        update_cache=update_cache,
+                    )
+        return x
+
+    def _decode_stack(self):
+        """The block stack as used by ``generate``, graph-captured on CUDA.
+
+        Decode latency at batch size 1 is dominated by CPU kernel-launch
+        overhead, not GPU work. Unlike per-token decoders this model has no
+        single fixed-shape step to hand to ``torch.cuda.CUDAGraph`` — every
+        scale runs two passes with its own sequence length — so capture goes
+        through ``torch.compile(mode="reduce-overhead")`` instead, whose
+        cudagraph trees record one graph per distinct (shape, pos)
+        specialization on the first generate call and replay them on every
+        later one. Warmup therefore compiles ~2 graphs per scale; steady-state
+        sampling is pure replay.
+        """
+        if self._compiled_decode_stack is None:
+            self._compiled_decode_stack = torch.compile(
+                self._run_stack, mode="reduce-overhead", fullgraph=True,
+                dynamic=False,
+            )
+        return self._compiled_decode_stack
+
+    def _stack(self):
+        """The block stack for teacher-forced forwards, compiled on CUDA.
+
+        The stack is graph-break free, so ``fullgraph=True`` traces all
+        n_layers blocks into one inductor graph: no Python dispatch between
+        blocks and cross-layer fusion of the AdaLN/attention/FFN boundaries.
+        Decode uses the separate reduce-overhead wrapper above, whose
+        cudagraph capture suits inference but not the training backward.
+        """
+        if self._compiled_stack is None:
+            self._compiled_stack = torch.compile(
+                self._run_stack, fullgraph=True, dynamic=False
+            )
+        return self._compiled_stack
+
+    def _head(self, x: torch.Tensor) -> torch.Tensor:
+        """Final norm and vocab projection, autocast to match the stack."""
+        with torch.autocast(
+            device_type=x.device.type,
+            dtype=torch.bfloat16,
+            enabled=x.device.type == "cuda",
+        ):
+            return self.to_logits(self.norm_out(x))
+
+    @torch.inference_mode()
+    def generate(
+        self,
+        batch_size: int = 1,
+        labels: Optional[torch.Tensor] = None,
+        temperature: float = 1.0,
+        top_k: int = 100,
+        top_p: float = 0.95,
+        device: Optional[torch.device] = None,
+        use_cache: bool = True,
+    ) -> torch.Tensor:
+        """Sample multi-scale token sequences autoregressively.
+
+        Args:
+            batch_size: Number of sequences to sample.
+            labels: Class labels of shape ``[batch_size]``; sampled uniformly
+                if omitted.
+            temperature: Softmax temperature.
+            top_k: Top-k sampling cutoff (0 = disabled).
+            top_p: Nucleus sampling cutoff (1.0 = disabled).
+            device: Device to sample on; defaults to the model's device.
+            use_cache: Sample each scale in a single parallel forward pass
+                against the cached prefix, following the paper's next-scale
+                formulation: tokens within one scale are conditionally
+                independent given all previous scales, so a scale's queries
+                attend the cached context but not each other. When False,
+                falls back to strict token-by-token autoregression with full
+                recomputation (reference path; note the two modes define
+                slightly different within-scale conditioning).
+
+        Returns:
+            Long tensor of shape ``[batch_size, total_seq_len]``.
+        """
+        device = device if device is not None else next(self.parameters()).device
+        if labels is None:
+            labels = torch.randint(0, self.num_classes, (batch_size,), device=device)
+        condition = self.class_embedding(labels)
+        # All per-layer AdaLN terms for the whole generation, one GEMM.
+        cond_scale_shift = self._cond_scale_shift(condition)
+        dtype = self.class_embedding.weight.dtype
+        # Caches hold what the blocks produce: BF16 under CUDA autocast.
+        cache_dtype = torch.bfloat16 if device.type == "cuda" else dtype
+
+        # Per-scale 2D spatial encoding, assembled once and sliced per step;
+        # sequence position itself is rotary, applied inside attention.
+        full_pe = self._scale_pos_encoding(self.total_seq_len, device, dtype)
+        kv_caches = None
+        if use_cache:
+            kv_cache = self.allocate_kv_cache(batch_size, device, cache_dtype)
+            kv_caches = [
+                (kv_cache[i, 0], kv_cache[i, 1])
+                for i in range(len(self.transformer_blocks))
+            ]
+
+        # One up-front allocation; scales/steps write into their slice.  The
+        # old torch.cat per step reallocated and recopied the growing
+        # sequence — O(L^2) copied elements over a full generation.
+        generated = torch.empty(
+            batch_size, self.total_seq_len, dtype=torch.long, device=device
+        )
+        if use_cache:
+            run_stack = (
+                self._decode_stack() if device.type == "cuda" else self._run_stack
+            )
+            starts, ends = compute_scale_positions(self.max_scale)
+            for i, (scale, num_tokens) in enumerate(get_multi_scale_patches(self.max_scale)):
+                start, end = starts[i], ends[i]
+                if i == 0:
+                    # The class token is both the first query and permanent
+                    # context; its K/V stay in the cache.
+                    x = condition.unsqueeze(1) + full_pe[0:1]
+                    rope = (self.rope_cos[0:1], self.rope_sin[0:1])
+                    update_cache = True
+                else:
+                    # Placeholder queries for the whole scale: positional
+                    # information only, attending every previous scale but
+                    # not each other (their K/V are never written).
+                    x = full_pe[start:end].unsqueeze(0).expand(
+                        batch_size, num_tokens, self.d_model
+                    )
+                    rope = (self.rope_cos[start:end], self.rope_sin[start:end])
+                    update_cache = False
+                x = run_stack(
+                    x, cond_scale_shift, rope=rope, kv_caches=kv_caches,
+                    pos=start + (i > 0), update_cache=update_cache,
+                )
+                scale_tokens = sample_from_logits(
+                    self._head(x), temperature=temperature, top_k=top_k, top_p=top_p
+                )
+                generated[:, start:end] = scale_tokens
+
+                if end < self.total_seq_len:
+                    # Extend the cache with the sampled tokens so they become
+                    # context for the following scales.
+                    ext = self.token_embedding(scale_tokens) + full_pe[start + 1 : end + 1]
+                    ext_rope = (
+                        self.rope_cos[start + 1 : end + 1],
+                        self.rope_sin[start + 1 : end + 1],
+                    )
+                    run_stack(
+                        ext, cond_scale_shift, rope=ext_rope, kv_caches=kv_caches,
+                        pos=start + 1, update_cache=True,
+                    )
+            return generated
+
+        pos = 0
+        for scale, num_tokens in get_multi_scale_patches(self.max_scale):
+            for _ in range(num_tokens):
+                x = torch.cat(
+                    (condition.unsqueeze(1), self.token_embedding(generated[:, :pos])),
+                    dim=1,
+                )
+                x = x + full_pe[: x.size(1)]
+                rope = (self.rope_cos[: x.size(1)], self.rope_sin[: x.size(1)])
+                x = self._run_stack(x, cond_scale_shift, rope=rope)
+                next_token = sample_from_logits(
+                    self._head(x[:, -1, :]),
+                    temperature=temperature, top_k=top_k, top_p=top_p,
+                )
+                generated[:, pos] = next_token
+                pos += 1
+        return generated
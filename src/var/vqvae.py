@@ -0,0 +1,228 @@
+"""VQ-VAE image tokenizer: encodes images to discrete codebook indices and back."""
+
+from typing import Optional, Tuple
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from .utils import get_multi_scale_patches
+
+
+class ResidualBlock(nn.Module):
+    """Two 3x3 convolutions with a residual connection."""
+
+    def __init__(self, channels: int):
+        super().__init__()
+        self.conv1 = nn.Conv2d(channels, channels, kernel_size=3, padding=1)
+        self.conv2 = nn.Conv2d(channels, channels, kernel_size=3, padding=1)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        h = F.relu(self.conv1(x))
+        h = self.conv2(h)
+        return F.relu(x + h)
+
+
+class VectorQuantizer(nn.Module):
+    """Nearest-neighbour vector quantization with a straight-through estimator."""
+
+    def __init__(self, num_embeddings: int, embedding_dim: int, commitment_cost: float = 0.25):
+        super().__init__()
+        self.num_embeddings = num_embeddings
+        self.embedding_dim = embedding_dim
+        self.commitment_cost = commitment_cost
+        self.embeddings = nn.Embedding(num_embeddings, embedding_dim)
+        self.embeddings.weight.data.uniform_(-1.0 / num_embeddings, 1.0 / num_embeddings)
+        self._e_sq_cache: Optional[torch.Tensor] = None
+        self._e_sq_version = -1
+
+    def _embedding_sq_norms(self) -> torch.Tensor:
+        """Per-code squared norms, cached while the codebook is unchanged.
+
+        In eval the codebook is frozen across thousands of ``get_indices``
+        calls, so the reduction is computed once and invalidated via the
+        weight's in-place version counter (optimizer steps and state-dict
+        loads both bump it). Training recomputes every call: the weights
+        change each step and the term must stay in the autograd graph.
+        """
+        weight = self.embeddings.weight
+        if self.training:
+            return weight.pow(2).sum(dim=1)
+        if (
+            self._e_sq_cache is None
+            or self._e_sq_version != weight._version
+            or self._e_sq_cache.device != weight.device
+        ):
+            self._e_sq_cache = weight.detach().pow(2).sum(dim=1)
+            self._e_sq_version = weight._version
+        return self._e_sq_cache
+
+    def get_indices(self, z: torch.Tensor) -> torch.Tensor:
+        """Return the nearest codebook index for each spatial position.
+
+        Args:
+            z: Latents of shape ``[batch, embedding_dim, h, w]``.
+
+        Returns:
+            Long tensor of shape ``[batch, h, w]``.
+        """
+        # For channels_last latents the permute already has contiguous
+        # strides, so this reshape is a free view, not a copy.
+        flat_z = z.permute(0, 2, 3, 1).reshape(-1, self.embedding_dim)
+        # Only the argmin matters, and ||z||^2 is constant per row, so the
+        # usual three-term expansion reduces to ||e||^2 - 2 z.e — a single
+        # fused addmm with no [N, 1] / [N, K] intermediates.
+        e_sq = self._embedding_sq_norms()
+        distances = torch.addmm(
+            e_sq, flat_z, self.embeddings.weight.t(), beta=1, alpha=-2
+        )
+        return distances.argmin(dim=1).view(z.size(0), z.size(2), z.size(3))
+
+    def forward(self, z: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        """Quantize latents.
+
+        Args:
+            z: Latents of shape ``[batch, embedding_dim, h, w]``.
+
+        Returns:
+            Tuple of quantized latents (same shape as ``z``), the VQ loss and
+            the codebook indices of shape ``[batch, h, w]``.
+        """
+        indices = self.get_indices(z)
+        # Both permutes below are stride changes only: with channels_last
+        # latents nothing here copies, where the old contiguous() round-trips
+        # rewrote the full tensor twice per forward.
+        z_perm = z.permute(0, 2, 3, 1)
+        quantized = self.embeddings(indices)
+        e_latent_loss = F.mse_loss(quantized.detach(), z_perm)
+        q_latent_loss = F.mse_loss(quantized, z_perm.detach())
+        loss = q_latent_loss + self.commitment_cost * e_latent_loss
+        # Straight-through: copy gradients from quantized to encoder output.
+        quantized = z_perm + (quantized - z_perm).detach()
+        return quantized.permute(0, 3, 1, 2), loss, indices
+
+
+class VQVAE(nn.Module):
+    """Convolutional VQ-VAE producing a 2D grid of discrete tokens per image."""
+
+    def __init__(
+        self,
+        in_channels: int = 3,
+        hidden_dim: int = 128,
+        embedding_dim: int = 256,
+        num_embeddings: int = 4096,
+        commitment_cost: float = 0.25,
+    ):
+        super().__init__()
+        self.embedding_dim = embedding_dim
+        self.num_embeddings = num_embeddings
+        self.encoder = nn.Sequential(
+            nn.Conv2d(in_channels, hidden_dim, kernel_size=4, stride=2, padding=1),
+            nn.ReLU(inplace=True),
+            nn.Conv2d(hidden_dim, hidden_dim, kernel_size=4, stride=2, padding=1),
+            ResidualBlock(hidden_dim),
+            ResidualBlock(hidden_dim),
+            nn.Conv2d(hidden_dim, embedding_dim, kernel_size=3, padding=1),
+        )
+        self.quantizer = VectorQuantizer(num_embeddings, embedding_dim, commitment_cost)
+        self.decoder = nn.Sequential(
+            nn.Conv2d(embedding_dim, hidden_dim, kernel_size=3, padding=1),
+            ResidualBlock(hidden_dim),
+            ResidualBlock(hidden_dim),
+            nn.ConvTranspose2d(hidden_dim, hidden_dim, kernel_size=4, stride=2, padding=1),
+            nn.ReLU(inplace=True),
+            nn.ConvTranspose2d(hidden_dim, in_channels, kernel_size=4, stride=2, padding=1),
+            nn.Tanh(),
+        )
+        # NHWC (channels_last) strides put every conv on cuDNN's tensor-core
+        # implicit-GEMM path, which NCHW FP32 misses; it also makes the
+        # quantizer's channel-dim reshapes free views.
+        self.to(memory_format=torch.channels_last)
+
+    @staticmethod
+    def _autocast(device: torch.device):
+        """BF16 autocast on CUDA, matching the transformer's compute dtype."""
+        return torch.autocast(
+            device_type=device.type, dtype=torch.bfloat16,
+            enabled=device.type == "cuda",
+        )
+
+    def forward(self, x: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        """Reconstruct images through the quantized bottleneck.
+
+        Args:
+            x: Images of shape ``[batch, channels, height, width]`` in [-1, 1].
+
+        Returns:
+            Tuple of reconstructions, VQ loss and codebook indices.
+        """
+        x = x.contiguous(memory_format=torch.channels_last)
+        with self._autocast(x.device):
+            z = self.encoder(x)
+            quantized, vq_loss, indices = self.quantizer(z)
+            recon = self.decoder(quantized)
+        return recon, vq_loss, indices
+
+    def get_codebook_indices(
+        self, images: torch.Tensor, max_scale: Optional[int] = None
+    ) -> torch.Tensor:
+        """Tokenize images into the flattened multi-scale index sequence.
+
+        The encoder runs once; each scale's token map is obtained by average
+        pooling the latents down to ``scale x scale`` and quantizing.
+
+        Args:
+            images: Images of shape ``[batch, channels, height, width]``.
+            max_scale: Largest scale in the schedule; defaults to the native
+                latent resolution.
+
+        Returns:
+            Long tensor of shape ``[batch, sum(s^2 for s in 1..max_scale)]``.
+        """
+        images = images.contiguous(memory_format=torch.channels_last)
+        with self._autocast(images.device):
+            z = self.encoder(images)
+            if max_scale is None:
+                max_scale = z.size(-1)
+            tokens = []
+            for scale, num_tokens in get_multi_scale_patches(max_scale):
+                z_scale = z if scale == z.size(-1) else F.adaptive_avg_pool2d(z, scale)
+                tokens.append(self.quantizer.get_indices(z_scale).view(-1, num_tokens))
+        return torch.cat(tokens, dim=1)
+
+    def decode_from_flat_indices(self, tokens: torch.Tensor, scale: int) -> torch.Tensor:
+        """Decode the trailing ``scale * scale`` tokens of a flat sequence.
+
+        Slices via ``narrow`` + ``reshape`` so the grid stays a view whenever
+        the strides allow (always for batch size 1), instead of forcing a
+        contiguous copy at every call site.
+
+        Args:
+            tokens: Flat multi-scale sequence of shape ``[batch, seq_len]``.
+            scale: Side length of the final grid.
+
+        Returns:
+            Images of shape ``[batch, channels, scale * 4, scale * 4]``.
+        """
+        num_tokens = scale * scale
+        grid = tokens.narrow(1, tokens.size(1) - num_tokens, num_tokens)
+        return self.decode_from_indices(grid.reshape(-1, scale, scale))
+
+    def decode_from_indices(self, indices: torch.Tensor) -> torch.Tensor:
+        """Decode a square grid of codebook indices back to images.
+
+        Args:
+            indices: Long tensor of shape ``[batch, scale, scale]``.
+
+        Returns:
+            Images of shape ``[batch, channels, scale * 4, scale * 4]``.
+        """
+        # The [B, s, s, C] lookup permuted to NCHW already has channels_last
+        # strides, so this contiguous call is a no-op rather than a copy.
+        quantized = (
+            self.quantizer.embeddings(indices)
+            .permute(0, 3, 1, 2)
+            .contiguous(memory_format=torch.channels_last)
+        )
+        with self._autocast(quantized.device):
+            return self.decoder(quantized).float()